@@ -1,12 +1,31 @@
 # dashboard.py — Secrets-only, always auto-refresh, Dry Run / Install with Success & Fail tables (+ StoreName mapping)
 
 import os
+import re
+import csv
 import json
+import hashlib
+import heapq
+import tempfile
+import time
+from operator import itemgetter
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
 from azure.storage.blob import BlobServiceClient
 from streamlit_autorefresh import st_autorefresh
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # orjson is optional; stdlib json also accepts bytes
+    from json import loads as _json_loads
+
 # ---------------- Secrets ----------------
 def _get_secret(path: str, default=None):
     try:
@@ -32,10 +51,29 @@ CSV_CANDIDATES = [
 ]
 
 @st.cache_data(show_spinner=False)
-def load_store_map():
+def _read_store_csv(path: str, mtime: float) -> pd.Series:
+    """
+    SERVICETAG -> StoreName lookup Series, read with csv.DictReader (no DataFrame for a ~200-row file).
+    Requires CSV with columns exactly: ServiceTag, StoreName. `mtime` is only a cache key.
+    """
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            mapping = {
+                row["ServiceTag"].strip().upper(): (row["StoreName"] or "").strip()
+                for row in csv.DictReader(f)
+                if (row["ServiceTag"] or "").strip()
+            }
+    except Exception as e:
+        st.warning(f"Failed to read store map CSV `{path}`: {e}")
+        return pd.Series(dtype=object)
+
+    st.caption(f"📄 Loaded store map: {len(mapping)} entries from `{os.path.basename(path)}`")
+    return pd.Series(mapping, dtype=object)
+
+def load_store_map() -> pd.Series:
     """
-    Returns a dict {SERVICETAG -> StoreName}.
-    Requires CSV with columns exactly: ServiceTag, StoreName.
+    Returns a Series {SERVICETAG -> StoreName} for Series.map.
+    Cached per file mtime, so edits to the CSV are picked up without a restart.
     """
     path = None
     for cand in CSV_CANDIDATES:
@@ -45,25 +83,28 @@ def load_store_map():
 
     if not path:
         st.warning("Store map CSV not found (looked for: " + ", ".join([f"`{p}`" for p in CSV_CANDIDATES]) + ").")
-        return {}
+        return pd.Series(dtype=object)
 
-    try:
-        df = pd.read_csv(path, usecols=["ServiceTag", "StoreName"])
-    except Exception as e:
-        st.warning(f"Failed to read store map CSV `{path}`: {e}")
-        return {}
-
-    # Normalize for matching
-    df["ServiceTag"] = df["ServiceTag"].astype(str).str.strip().str.upper()
-    df["StoreName"]  = df["StoreName"].astype(str).str.strip()
+    return _read_store_csv(path, os.path.getmtime(path))
 
-    mapping = dict(zip(df["ServiceTag"], df["StoreName"]))
-    st.caption(f"📄 Loaded store map: {len(mapping)} entries from `{os.path.basename(path)}`")
-    return mapping
-
-STORE_MAP = load_store_map()
+STORE_MAP_SERIES = load_store_map()
 
 # ---------------- Azure helpers ----------------
+DOWNLOAD_WORKERS = 32  # concurrent blob downloads (I/O-bound)
+
+def _pooled_transport() -> RequestsTransport:
+    """requests session whose connection pool is sized to the download pool."""
+    session = requests.Session()
+    # Retries stay with the Azure pipeline
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=DOWNLOAD_WORKERS * 2,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, connection_timeout=5, read_timeout=15)
+
 @st.cache_resource(show_spinner=False)
 def get_container_client():
     if not CONN_STRING or not CONTAINER:
@@ -76,34 +117,97 @@ def get_container_client():
             f"Detected -> connection_string: {_mask(CONN_STRING)}, container: {CONTAINER or '(missing)'}"
         )
         raise RuntimeError(msg)
-    svc = BlobServiceClient.from_connection_string(CONN_STRING)
+    svc = BlobServiceClient.from_connection_string(
+        CONN_STRING,
+        transport=_pooled_transport(),
+        retry_total=3,  # fail fast into a READ ERROR row; retried on the next frame ttl
+    )
     return svc.get_container_client(CONTAINER)
 
+@st.cache_resource(show_spinner=False)
+def get_download_pool() -> ThreadPoolExecutor:
+    """One process-wide download pool (survives reruns)."""
+    return ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="blob-dl")
+
+@st.cache_data(show_spinner=False, ttl=5)
+def _list_blob_meta_cached(prefix: str, max_blobs: int):
+    """Shared across sessions for one refresh interval; errors propagate (and are not cached)."""
+    cc = get_container_client()
+    # Core properties only (no include= datasets)
+    dated, undated = [], []
+    for b in cc.list_blobs(name_starts_with=prefix):
+        row = {"name": b.name, "etag": b.etag, "last_modified": b.last_modified}
+        (dated if b.last_modified is not None else undated).append(row)
+    # Newest max_blobs via a bounded heap; undated rows rank last
+    newest = heapq.nlargest(max_blobs, dated, key=itemgetter("last_modified"))
+    return newest + undated[:max_blobs - len(newest)]
+
 def list_blob_meta(prefix: str, max_blobs: int = 500):
-    """[{name, last_modified}] newest first; swallow errors to UI."""
+    """[{name, etag, last_modified}] newest first; swallow errors to UI."""
     try:
-        cc = get_container_client()
-        rows = []
-        for b in cc.list_blobs(name_starts_with=prefix):
-            rows.append({"name": b.name, "last_modified": getattr(b, "last_modified", None)})
-        rows.sort(
-            key=lambda r: pd.to_datetime(r["last_modified"]) if r["last_modified"] else pd.Timestamp.min,
-            reverse=True,
-        )
-        return rows[:max_blobs]
+        return _list_blob_meta_cached(prefix, max_blobs)
     except Exception as e:
         st.error(f"Listing blobs failed for `{prefix}`: {e}")
         return []
 
-def read_blob_text(name: str) -> str:
-    cc = get_container_client()
-    return cc.download_blob(name).readall().decode("utf-8", errors="replace")
+def iter_blob_lines(cc, name: str):
+    """Yield raw byte lines from download_blob().chunks().
+    download_blob() already fetches the first max_single_get_size (32 MiB by default), so most logs
+    are fully in memory before the first line; only larger blobs have later chunk GETs to skip."""
+    buf = b""
+    for chunk in cc.download_blob(name).chunks():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        yield from lines
+    if buf:
+        yield buf
 
 # ---------------- Minimal parser (6 fields) ----------------
-def parse_needed_fields(text: str) -> dict:
+_EARLY_EXIT_FIELDS = ("Model", "ServiceTag", "TotalRAM", "TPMError", "DiskSize")
+_SYSINFO_FIELDS = ("Model", "ServiceTag", "TotalRAM", "DiskSize")
+_LBRACE, _RBRACE = ord("{"), ord("}")
+# After the sysinfo fields: lines that may change the outcome (\u catches escaped JSON strings)
+_OUTCOME_RE = re.compile(rb"TPMChecked|InstallSkipped|error|\\u", re.IGNORECASE)
+
+# logfmt key -> output field
+_LOGFMT_FIELDS = {
+    b"sysinfo.Hardware.Model": "Model",
+    b"sysinfo.Hardware.ServiceTag": "ServiceTag",
+    b"sysinfo.Memory.totalRAM": "TotalRAM",
+    b"diskSize": "DiskSize",
+}
+# Value is either "quoted (spaces allowed)" or a bare token
+_LOGFMT_FIELD_RE = re.compile(
+    b"(" + b"|".join(re.escape(k) for k in _LOGFMT_FIELDS) + rb')=(?:"([^"]*)"|(\S+))'
+)
+_ERROR_RE = re.compile(rb'error="([^"]*)')
+_MSG_RE = re.compile(rb"msg=(\S+)")
+
+def _decode(value: bytes) -> str:
+    return value.decode("utf-8", errors="replace")
+
+def _loads_json_line(raw: bytes):
+    # orjson / json.loads(bytes) reject invalid UTF-8 outright; retry with replacement chars
+    try:
+        return _json_loads(raw)
+    except ValueError:
+        return _json_loads(_decode(raw))
+
+def _pick_error_from_logfmt(raw: bytes) -> str | None:
+    # Prefer error="..." if present
+    m = _ERROR_RE.search(raw)
+    if m:
+        return _decode(m.group(1))
+    # Fallback: try msg=... token if present
+    m = _MSG_RE.search(raw)
+    return _decode(m.group(1)) if m else None
+
+def parse_needed_fields(lines) -> dict:
     """
     Extract only: Model, ServiceTag, TotalRAM, TPMError, DiskSize, InstallError.
     Success=False if we see any ERROR-level line or an InstallSkipped with error.
+    Takes an iterable of byte lines (see iter_blob_lines); stops once all fields and a failure are known.
+    JSON and logfmt lines are both matched as bytes; only captured values are decoded.
     """
     out = {
         "Model": None,
@@ -114,26 +218,28 @@ def parse_needed_fields(text: str) -> dict:
         "InstallError": None,
         "Success": True,
     }
+    have_sysinfo = False
 
-    def _pick_error_from_logfmt(s: str) -> str | None:
-        # Prefer error="..." if present
-        if 'error="' in s:
-            return s.split('error="', 1)[1].split('"', 1)[0]
-        # Fallback: try msg=... token if present
-        if "msg=" in s:
-            part = s.split("msg=", 1)[1].split()[0]
-            return part.strip()
-        return None
+    for line in lines:
+        # Early break if all fields collected and we already know failure status
+        if out["InstallError"] is not None and all(out[k] is not None for k in _EARLY_EXIT_FIELDS):
+            break
+
+        # Header seen: skip lines without an outcome marker
+        if have_sysinfo:
+            if not _OUTCOME_RE.search(line):
+                continue
+        else:
+            have_sysinfo = all(out[k] is not None for k in _SYSINFO_FIELDS)
 
-    for line in text.splitlines():
-        s = line.strip()
-        if not s:
+        raw = line.strip()
+        if not raw:
             continue
 
         # ---------- JSON line ----------
-        if s.startswith("{") and s.endswith("}"):
+        if raw[0] == _LBRACE and raw[-1] == _RBRACE:
             try:
-                obj = json.loads(s)
+                obj = _loads_json_line(raw)
                 sysinfo = obj.get("sysinfo") or {}
                 hw = sysinfo.get("Hardware") or {}
                 mem = sysinfo.get("Memory") or {}
@@ -172,46 +278,114 @@ def parse_needed_fields(text: str) -> dict:
                     out["Success"] = False
             except Exception:
                 pass  # fall through to logfmt if not valid JSON
+            # Valid JSON falls through too: wrapped logfmt can carry the markers
 
         # ---------- logfmt line ----------
-        if out["Model"] is None and "sysinfo.Hardware.Model=" in s:
-            out["Model"] = s.split("sysinfo.Hardware.Model=")[-1].split()[0].strip('"')
-
-        if out["ServiceTag"] is None and "sysinfo.Hardware.ServiceTag=" in s:
-            out["ServiceTag"] = s.split("sysinfo.Hardware.ServiceTag=")[-1].split()[0].strip('"')
-
-        if out["TotalRAM"] is None and "sysinfo.Memory.totalRAM=" in s:
-            out["TotalRAM"] = s.split("sysinfo.Memory.totalRAM=")[-1].split()[0].strip('"')
+        # Skip lines without any of the keys below
+        if not (
+            b"sysinfo." in raw or b"diskSize=" in raw or b"level=ERROR" in raw
+            or b"msg=TPMChecked" in raw or b"msg=InstallSkipped" in raw
+        ):
+            continue
 
-        if out["TPMError"] is None and "msg=TPMChecked" in s and "error=" in s:
-            part = s.split('error="', 1)
-            if len(part) > 1:
-                out["TPMError"] = part[1].split('"', 1)[0]
+        # One regex pass picks up Model / ServiceTag / totalRAM / diskSize
+        for m in _LOGFMT_FIELD_RE.finditer(raw):
+            field = _LOGFMT_FIELDS[m.group(1)]
+            if out[field] is None:
+                out[field] = _decode(m.group(2) if m.group(2) is not None else m.group(3))
 
-        if out["DiskSize"] is None and "diskSize=" in s:
-            out["DiskSize"] = s.split("diskSize=")[-1].split()[0].strip('"')
+        if out["TPMError"] is None and b"msg=TPMChecked" in raw:
+            m = _ERROR_RE.search(raw)
+            if m:
+                out["TPMError"] = _decode(m.group(1))
 
         # InstallSkipped (logfmt)
-        if "msg=InstallSkipped" in s and "error=" in s:
-            err = s.split('error="', 1)[1].split('"', 1)[0]
-            out["InstallError"] = err
-            out["Success"] = False
+        if b"msg=InstallSkipped" in raw:
+            m = _ERROR_RE.search(raw)
+            if m:
+                out["InstallError"] = _decode(m.group(1))
+                out["Success"] = False
 
         # Any ERROR-level line (logfmt)
-        if "level=ERROR" in s:
-            err = _pick_error_from_logfmt(s)
+        if b"level=ERROR" in raw:
+            err = _pick_error_from_logfmt(raw)
             if err:
                 out["InstallError"] = err
             else:
                 out["InstallError"] = "ERROR"
             out["Success"] = False
 
-        # Early break if all fields collected and we already know failure status
-        if all(out[k] is not None for k in ["Model","ServiceTag","TotalRAM","TPMError","DiskSize"]) and out["InstallError"] is not None:
-            break
-
     return out
 
+# ---------------- Parsed-row disk cache (survives restarts) ----------------
+# Relative to this file, not the working directory; a relative [cache] dir resolves there too
+PARSE_CACHE_DIR = Path(__file__).resolve().parent / _get_secret("cache.dir", "cache/parsed")
+PARSE_CACHE_VERSION = 2  # bump whenever parse_needed_fields output changes
+PARSE_CACHE_MAX_AGE = 14 * 24 * 3600  # seconds since a row was last read or written
+
+def _parse_cache_path(name: str, etag: str) -> Path:
+    key = hashlib.sha1(f"{PARSE_CACHE_VERSION}\0{name}\0{etag}".encode("utf-8")).hexdigest()
+    return PARSE_CACHE_DIR / f"{key}.json"
+
+def _read_cached_row(path: Path) -> dict | None:
+    """Cached row, or None (re-parse) if unreadable or missing any column load_tab_frame fills."""
+    try:
+        row = _json_loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(row, dict) or any(c not in row for c in TAB_COLUMNS if c != "Date"):
+        return None
+    try:
+        os.utime(path)  # still in use: keep it out of _prune_parse_cache
+    except OSError:
+        pass
+    return row
+
+def _write_cached_row(path: Path, row: dict):
+    """Best-effort: write to a temp file then rename, so readers never see partial JSON."""
+    try:
+        PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=PARSE_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            json.dump(row, f)
+        os.replace(f.name, path)
+    except OSError:
+        pass
+
+@st.cache_resource(show_spinner=False, ttl=24 * 3600)
+def _prune_parse_cache() -> int:
+    """Delete rows and temp files untouched for PARSE_CACHE_MAX_AGE; at most daily. Returns the count."""
+    cutoff = time.time() - PARSE_CACHE_MAX_AGE
+    removed = 0
+    try:
+        entries = list(os.scandir(PARSE_CACHE_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith((".json", ".tmp")):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+_prune_parse_cache()
+
+@st.cache_data(show_spinner=False, max_entries=5000)
+def _fetch_and_parse(_cc, name: str, etag: str | None) -> dict:
+    """Download + parse one blob; cached per (name, etag) in memory and on disk (_cc is not hashed)."""
+    path = _parse_cache_path(name, etag) if etag else None
+    if path is not None:
+        row = _read_cached_row(path)
+        if row is not None:
+            return row
+    row = parse_needed_fields(iter_blob_lines(_cc, name))
+    if path is not None:
+        _write_cached_row(path, row)
+    return row
+
 # ---------------- UI ----------------
 st.set_page_config(page_title="FRD Readiness — Dry Run vs Install", layout="wide")
 
@@ -222,55 +396,90 @@ st.title("FRD Readiness — Dry Run vs Install")
 st.caption(f"Container: **{CONTAINER or '(missing)'}** • ConnStr(head): {_mask(CONN_STRING)} • Auto-refresh: 5s")
 
 MAX_BLOBS = 500  # adjust if you like
+TAB_COLUMNS = ["Date","Model","ServiceTag","TotalRAM","TPMError","DiskSize","InstallError","Success"]
+# Arrow-backed strings + nullable bool
+TAB_DTYPES = {
+    "Model": "string[pyarrow]",
+    "ServiceTag": "string[pyarrow]",
+    "TotalRAM": None,  # numeric when possible, see _numeric_or_string
+    "TPMError": "string[pyarrow]",
+    "DiskSize": None,
+    "InstallError": "string[pyarrow]",
+    "Success": "boolean",
+}
+
+def _numeric_or_string(values: list):
+    """Nullable Int64/Float64 if every present value is a number, else Arrow strings (units kept)."""
+    try:
+        nums = pd.to_numeric(pd.Series(values, dtype=object), errors="raise")
+    except (ValueError, TypeError):
+        return pd.array(values, dtype="string[pyarrow]")
+    return nums.convert_dtypes(convert_string=False, convert_boolean=False).array
 
 def _normalize_st(series: pd.Series) -> pd.Series:
     """Upper + strip for ServiceTag to match CSV mapping."""
-    return series.astype(str).str.strip().str.upper()
+    return series.str.strip().str.upper()
 
 def _apply_store_map(df: pd.DataFrame) -> pd.DataFrame:
-    """Add a 'StoreName' column from STORE_MAP using normalized ServiceTag."""
-    if not isinstance(STORE_MAP, dict) or not STORE_MAP:
+    """Add a 'StoreName' column from STORE_MAP_SERIES using normalized ServiceTag."""
+    if STORE_MAP_SERIES.empty:
         df["StoreName"] = None
         return df
-    norm = _normalize_st(df["ServiceTag"].fillna(""))
-    mapped = norm.map(STORE_MAP)
-    df["StoreName"] = mapped.where(pd.notna(mapped), None)
+    mapped = _normalize_st(df["ServiceTag"]).map(STORE_MAP_SERIES)
+    df["StoreName"] = mapped.astype("string[pyarrow]")
     return df
 
-def render_tab(prefix: str, title: str, max_blobs: int = MAX_BLOBS):
-    meta = list_blob_meta(prefix, max_blobs)
-    if not meta:
-        st.info(f"No blobs under `{prefix}`")
-        return
-
-    rows = []
-    for m in meta:
+@st.cache_data(show_spinner=False, ttl=60, max_entries=8)
+def load_tab_frame(blobs: tuple) -> pd.DataFrame:
+    """
+    One parsed row per blob for a listing snapshot of (name, etag, last_modified) tuples.
+    ttl lets transient READ ERROR rows retry.
+    """
+    # One list per column, filled by listing index (newest first)
+    cols = {c: [None] * len(blobs) for c in TAB_COLUMNS}
+    pool = get_download_pool()
+    cc = get_container_client()
+    futures = {pool.submit(_fetch_and_parse, cc, name, etag): (i, lm) for i, (name, etag, lm) in enumerate(blobs)}
+    for fut in as_completed(futures):
         try:
-            text = read_blob_text(m["name"])
-            row = parse_needed_fields(text)
-            row["Date"] = (
-                pd.to_datetime(m["last_modified"]).strftime("%Y-%m-%d %H:%M:%S")
-                if m["last_modified"] else None
-            )
-            rows.append(row)
+            row = fut.result()
         except Exception as e:
-            rows.append({
+            row = {
                 "Model": None, "ServiceTag": None, "TotalRAM": None,
                 "TPMError": f"READ ERROR: {e}", "DiskSize": None, "InstallError": None,
-                "Success": False, "Date": None
-            })
+                "Success": False,
+            }
+        i, row["Date"] = futures[fut]
+        for c, values in cols.items():
+            values[i] = row[c]
+
+    return pd.DataFrame({
+        # tz-aware UTC -> naive UTC for display
+        "Date": pd.to_datetime(cols["Date"], utc=True).tz_convert(None),
+        **{
+            c: pd.array(cols[c], dtype=dtype) if dtype else _numeric_or_string(cols[c])
+            for c, dtype in TAB_DTYPES.items()
+        },
+    })
 
-    df = pd.DataFrame(
-        rows,
-        columns=["Date","Model","ServiceTag","TotalRAM","TPMError","DiskSize","InstallError","Success"]
-    )
+def render_tab(prefix: str, title: str, max_blobs: int = MAX_BLOBS):
+    meta = list_blob_meta(prefix, max_blobs)
+    if not meta:
+        st.info(f"No blobs under `{prefix}`")
+        return
 
-    if "Date" in df:
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-        df = df.sort_values("Date", ascending=False, na_position="last")
+    with st.spinner(f"Fetching {len(meta)} blob(s)…"):
+        df = load_tab_frame(tuple((m["name"], m["etag"], m["last_modified"]) for m in meta))
 
     # Only keep the latest record per ServiceTag; split by latest state
-    latest = df.sort_values("Date").drop_duplicates("ServiceTag", keep="last")
+    idx = (
+        df["Date"].fillna(pd.Timestamp.min)
+        .groupby(df["ServiceTag"], dropna=False, sort=False)
+        .idxmax()
+        .to_numpy()  # df has a RangeIndex, so labels are positions
+    )
+    # Oldest first, NaT last
+    latest = df.take(idx[np.argsort(df["Date"].to_numpy()[idx], kind="stable")])
 
     # Attach StoreName from CSV mapping
     latest = _apply_store_map(latest)
@@ -278,8 +487,9 @@ def render_tab(prefix: str, title: str, max_blobs: int = MAX_BLOBS):
     # Reorder columns for display
     display_cols = ["Date","StoreName","Model","ServiceTag","TotalRAM","TPMError","DiskSize","InstallError"]
 
-    success_df = latest[latest["Success"]].drop(columns=["Success"]).reindex(columns=display_cols)
-    fail_df    = latest[~latest["Success"]].drop(columns=["Success"]).reindex(columns=display_cols)
+    mask = latest["Success"].to_numpy(dtype=bool, na_value=False)
+    success_df = latest.loc[mask, display_cols]
+    fail_df    = latest.loc[~mask, display_cols]
 
     st.subheader(f"{title} — Success")
     st.dataframe(success_df, use_container_width=True, height=300)
@@ -289,8 +499,8 @@ def render_tab(prefix: str, title: str, max_blobs: int = MAX_BLOBS):
 
     st.caption(f"Scanned {len(meta)} blob(s) under `{prefix}`")
 
-tab1, tab2 = st.tabs(["Dry Run", "Install"])
-with tab1:
-    render_tab("devices/dryrun/", "Dry Run")
-with tab2:
-    render_tab("devices/install/", "Install")
+TABS = {"Dry Run": "devices/dryrun/", "Install": "devices/install/"}
+
+# Only the selected view is listed + parsed on each refresh
+active = st.radio("View", list(TABS), horizontal=True, key="active_tab", label_visibility="collapsed")
+render_tab(TABS[active], active)
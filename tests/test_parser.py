@@ -0,0 +1,30 @@
+"""parse_needed_fields checks. Run from the repo root: python -m unittest discover tests"""
+import unittest
+
+from dashboard import parse_needed_fields
+
+
+def _parse(*lines: bytes) -> dict:
+    return parse_needed_fields(iter(lines))
+
+
+class NonUtf8Test(unittest.TestCase):
+    def test_json_error_line_is_still_a_failure(self):
+        row = _parse(b'{"level":"ERROR","msg":"InstallFailed","error":"F\xfcr"}')
+        self.assertFalse(row["Success"])
+        self.assertEqual(row["InstallError"], "F\ufffdr")
+
+    def test_json_header_keeps_sysinfo_fields(self):
+        row = _parse(
+            b'{"sysinfo":{"Hardware":{"Model":"Latitude \xe9","ServiceTag":"ABC1"},'
+            b'"Memory":{"totalRAM":16}},"diskSize":512}'
+        )
+        self.assertEqual(row["Model"], "Latitude \ufffd")
+        self.assertEqual(row["ServiceTag"], "ABC1")
+        self.assertEqual(row["TotalRAM"], 16)
+        self.assertEqual(row["DiskSize"], 512)
+        self.assertTrue(row["Success"])
+
+
+if __name__ == "__main__":
+    unittest.main()